@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+"""TheBigHop — small Flask backend for the donation log site.
+
+A submit verifies a Bitcoin transaction against our address via the
+Blockstream API, geocodes the donor's city with Nominatim, stores the
+entry in SQLite and re-exports ``site/data/log.json`` for the static map.
+"""
+
+import atexit
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, Response, abort, request, send_from_directory
+from requests.adapters import HTTPAdapter, Retry
+from werkzeug.security import safe_join
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json works, just slower
+    orjson = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SITE_DIR = os.path.join(BASE_DIR, "site")
+DATA_DIR = os.path.join(SITE_DIR, "data")
+DB_PATH = os.environ.get("BIGHOP_DB", os.path.join(BASE_DIR, "bighop.db"))
+
+BTC_ADDRESS = os.environ.get(
+    "BIGHOP_BTC_ADDRESS", "bc1qthebighop0000000000000000000000000000000"
+)
+BLOCKSTREAM_API = "https://blockstream.info/api"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+UA = "TheBigHop/1.0 (+https://github.com/Jra5639-gif/TheBigHop)"
+
+PROJECT_NAME = "The Big Hop"
+RATE_LIMIT_MAX = 5
+RATE_LIMIT_WINDOW_S = 60.0
+
+app = Flask(__name__, static_folder=None)
+
+# One session for all outbound calls: keeps TCP+TLS connections to
+# blockstream.info and Nominatim alive across submits instead of paying
+# the ~100-300 ms handshake per request.
+_http = requests.Session()
+_http.headers["User-Agent"] = UA
+_http.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=2, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504)
+        ),
+    ),
+)
+
+_buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+_buckets_lock = threading.Lock()
+_BUCKET_CAPACITY = float(RATE_LIMIT_MAX)
+_BUCKET_REFILL = RATE_LIMIT_MAX / RATE_LIMIT_WINDOW_S
+_MAX_BUCKETS = 10000
+
+_write_lock = threading.Lock()
+_writer: sqlite3.Connection | None = None
+_local = threading.local()
+
+
+def _tune(con):
+    """Apply the per-connection PRAGMAs.
+
+    journal_mode=WAL is set once in init_db() and persists in the database
+    file; everything here is per-connection.
+    """
+    if DB_PATH != ":memory:":
+        con.executescript(
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA busy_timeout=5000;"
+            "PRAGMA cache_size=-20000;"
+            "PRAGMA temp_store=MEMORY;"
+            "PRAGMA foreign_keys=ON;"
+        )
+
+
+def db():
+    """Open a fresh tuned connection (setup/maintenance paths only).
+
+    isolation_level=None keeps reads out of implicit transactions —
+    writers issue BEGIN IMMEDIATE explicitly.
+    """
+    con = sqlite3.connect(DB_PATH, isolation_level=None)
+    _tune(con)
+    return con
+
+
+def get_reader():
+    """Per-thread read-only connection, opened once and reused.
+
+    WAL lets any number of these run alongside the single writer without
+    blocking, and mode=ro guarantees a request handler can never write
+    through the wrong handle.
+    """
+    con = getattr(_local, "reader", None)
+    if con is None:
+        con = sqlite3.connect(
+            f"file:{DB_PATH}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        con.executescript("PRAGMA busy_timeout=5000;PRAGMA temp_store=MEMORY;")
+        con.row_factory = sqlite3.Row
+        _local.reader = con
+    return con
+
+
+def get_writer():
+    """The single shared write connection; callers must hold _write_lock."""
+    global _writer
+    if _writer is None:
+        _writer = sqlite3.connect(
+            DB_PATH, isolation_level=None, check_same_thread=False
+        )
+        _tune(_writer)
+    return _writer
+
+
+@atexit.register
+def _close_writer():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def init_db():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    con = db()
+    try:
+        if DB_PATH != ":memory:":
+            con.execute("PRAGMA journal_mode=WAL")
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                txid TEXT NOT NULL UNIQUE,
+                alias TEXT NOT NULL,
+                city TEXT NOT NULL,
+                country TEXT NOT NULL,
+                lat REAL NOT NULL,
+                lng REAL NOT NULL,
+                amount_btc REAL NOT NULL,
+                iso_date TEXT NOT NULL
+            )"""
+        )
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS geo_cache (
+                key TEXT PRIMARY KEY,
+                lat REAL NOT NULL,
+                lng REAL NOT NULL,
+                ts INTEGER NOT NULL
+            )"""
+        )
+    finally:
+        con.close()
+    # /api/log serves this file directly, and the background worker may
+    # not have flushed the last submits before a previous shutdown, so
+    # rewrite it unconditionally — one cheap scan at boot.
+    export_log_json()
+
+
+if orjson is not None:
+
+    def _json_bytes(obj):
+        return orjson.dumps(obj)
+
+else:
+
+    def _json_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def fast_json(payload, status=200):
+    """Serialize *payload* with the fastest available encoder."""
+    return Response(_json_bytes(payload), status=status, mimetype="application/json")
+
+
+_iso_cache: list = [0, ""]
+
+
+def utc_now_iso():
+    """Current UTC time as e.g. 2026-08-31T12:00:00Z, cached per second."""
+    now = int(time.time())
+    if now != _iso_cache[0]:
+        _iso_cache[:] = [now, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))]
+    return _iso_cache[1]
+
+
+_WS_RE = re.compile(r"\s+")
+
+
+def sanitize_text(s, max_len=40):
+    s = (s or "").strip()
+    s = _WS_RE.sub(" ", s)
+    return s[:max_len]
+
+
+def valid_txid(txid):
+    """True if *txid* is exactly 64 hex chars — validated by bytes.fromhex.
+
+    fromhex skips ASCII spaces, so the decoded length is checked too.
+    """
+    if not txid or len(txid) != 64:
+        return False
+    try:
+        return len(bytes.fromhex(txid)) == 32
+    except ValueError:
+        return False
+
+
+def rate_limited(ip):
+    """Token bucket per IP: O(1) per check, LRU-bounded to _MAX_BUCKETS IPs."""
+    now = time.time()
+    with _buckets_lock:
+        tokens, last = _buckets.get(ip, (_BUCKET_CAPACITY, now))
+        tokens = min(_BUCKET_CAPACITY, tokens + (now - last) * _BUCKET_REFILL)
+        if tokens < 1.0:
+            _buckets[ip] = (tokens, now)
+            _buckets.move_to_end(ip)
+            return True
+        _buckets[ip] = (tokens - 1.0, now)
+        _buckets.move_to_end(ip)
+        while len(_buckets) > _MAX_BUCKETS:
+            _buckets.popitem(last=False)
+    return False
+
+
+def tx_amount_to_our_address_btc(txid, addr):
+    """Return BTC paid to *addr* by *txid*, or None if the tx pays us nothing."""
+    r = _http.get(f"{BLOCKSTREAM_API}/tx/{txid}", timeout=15)
+    if r.status_code != 200:
+        return None
+    tx = r.json()
+    sats = sum(
+        int(o["value"])
+        for o in tx.get("vout", ())
+        if o.get("scriptpubkey_address") == addr
+    )
+    if sats <= 0:
+        return None
+    return sats / 1e8
+
+
+def address_balance_btc(addr):
+    r = _http.get(f"{BLOCKSTREAM_API}/address/{addr}", timeout=15)
+    if r.status_code != 200:
+        return None
+    stats = r.json().get("chain_stats", {})
+    sats = stats.get("funded_txo_sum", 0) - stats.get("spent_txo_sum", 0)
+    return sats / 1e8
+
+
+_bal_cache = {"val": None, "ts": 0.0}
+_bal_lock = threading.Lock()
+_BAL_TTL = 30.0
+
+
+def address_balance_cached(addr):
+    """address_balance_btc behind a short TTL cache.
+
+    Balances move at most once per block (~10 min), so 30 s staleness is
+    invisible while sparing blockstream.info a >1 s round-trip per poll.
+    Holding the lock across the fetch coalesces concurrent misses into a
+    single upstream call. Failed fetches are not cached.
+    """
+    with _bal_lock:
+        if time.time() - _bal_cache["ts"] < _BAL_TTL:
+            return _bal_cache["val"]
+        val = address_balance_btc(addr)
+        if val is not None:
+            _bal_cache.update(val=val, ts=time.time())
+        return val
+
+
+_GEO_CACHE_TTL_S = 30 * 24 * 3600
+
+
+def geocode_city_country(city, country):
+    """Resolve (city, country) to (lat, lng), caching hits in geo_cache.
+
+    Repeat cities skip the ~200-800 ms Nominatim round-trip entirely, and
+    the cache doubles as rate-limit protection against their API. Entries
+    expire after 30 days.
+    """
+    key = f"{city.strip().lower()}|{country.strip().lower()}"
+    cached = get_reader().execute(
+        "SELECT lat, lng, ts FROM geo_cache WHERE key = ?", (key,)
+    ).fetchone()
+    if cached is not None and time.time() - cached["ts"] < _GEO_CACHE_TTL_S:
+        return cached["lat"], cached["lng"]
+    r = _http.get(
+        NOMINATIM_URL,
+        params={"city": city, "country": country, "format": "json", "limit": 1},
+        timeout=15,
+    )
+    if r.status_code != 200:
+        return None
+    results = r.json()
+    if not results:
+        return None
+    lat = float(results[0]["lat"])
+    lng = float(results[0]["lon"])
+    with _write_lock:
+        get_writer().execute(
+            "INSERT OR REPLACE INTO geo_cache(key, lat, lng, ts) VALUES(?,?,?,?)",
+            (key, lat, lng, int(time.time())),
+        )
+    return lat, lng
+
+
+_LOG_COLUMNS = ("txid", "alias", "city", "country", "lat", "lng", "amount_btc", "iso_date")
+_LOG_QUERY = (
+    "SELECT txid,alias,city,country,lat,lng,amount_btc,iso_date"
+    " FROM entries ORDER BY id"
+)
+
+
+def export_log_json():
+    """Stream site/data/log.json row by row and swap it in atomically.
+
+    Serializing per row keeps peak memory at ~one entry regardless of log
+    size, and os.replace() means readers of the file never observe a
+    partial write.
+    """
+    project = _json_bytes(
+        {
+            "name": PROJECT_NAME,
+            "address": BTC_ADDRESS,
+            "exported_iso": utc_now_iso(),
+        }
+    )
+    cur = get_reader().cursor()
+    cur.row_factory = None
+    tmp = tempfile.NamedTemporaryFile(
+        "wb", dir=DATA_DIR, prefix=".log.json.", delete=False
+    )
+    try:
+        with tmp as f:
+            f.write(b'{"project": ' + project + b', "entries": [')
+            sep = b""
+            for row in cur.execute(_LOG_QUERY):
+                f.write(sep)
+                f.write(_json_bytes(dict(zip(_LOG_COLUMNS, row))))
+                sep = b","
+            f.write(b"]}")
+            # NamedTemporaryFile creates 0600; the file is a public site
+            # asset, so restore the mode a plain open() would have given.
+            os.fchmod(f.fileno(), 0o644)
+        os.replace(tmp.name, os.path.join(DATA_DIR, "log.json"))
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+
+
+_INSERT_ENTRY = (
+    "INSERT INTO entries(txid,alias,city,country,lat,lng,amount_btc,iso_date)"
+    " VALUES(?,?,?,?,?,?,?,?) ON CONFLICT(txid) DO NOTHING"
+)
+
+
+def bulk_insert(rows):
+    """Insert many entry tuples (in _INSERT_ENTRY column order) at once.
+
+    One executemany inside a single transaction — SQLite's per-statement
+    overhead dominates small rows, so this is the path for admin imports
+    and backfills. Returns the number of rows actually inserted, which
+    may be less than len(rows) since already-logged txids are skipped.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    with _write_lock:
+        writer = get_writer()
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            cur = writer.executemany(_INSERT_ENTRY, rows)
+            writer.execute("COMMIT")
+        except BaseException:
+            writer.execute("ROLLBACK")
+            raise
+    if cur.rowcount:
+        request_export()
+    return cur.rowcount
+
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="upstream")
+
+_export_event = threading.Event()
+_export_worker_started = False
+_export_worker_lock = threading.Lock()
+
+
+def _export_worker():
+    while True:
+        _export_event.wait()
+        _export_event.clear()
+        time.sleep(0.5)  # coalesce a burst of submits into one file write
+        try:
+            export_log_json()
+        except Exception:
+            app.logger.exception("log.json export failed")
+
+
+def request_export():
+    """Ask the background worker to rewrite log.json soon.
+
+    Submits just flip an event instead of rewriting the whole file inside
+    the request; N quick inserts collapse into at most two writes.
+    """
+    global _export_worker_started
+    if not _export_worker_started:
+        with _export_worker_lock:
+            if not _export_worker_started:
+                threading.Thread(
+                    target=_export_worker, daemon=True, name="log-export"
+                ).start()
+                _export_worker_started = True
+    _export_event.set()
+
+
+@app.post("/api/submit")
+def api_submit():
+    ip = (
+        request.headers.get("X-Forwarded-For", request.remote_addr or "?")
+        .split(",")[0]
+        .strip()
+    )
+    if rate_limited(ip):
+        return fast_json({"ok": False, "error": "rate limited, slow down"}, 429)
+
+    data = request.get_json(silent=True) or {}
+    # Lowercase so case variants of the same txid hit the UNIQUE index.
+    txid = (data.get("txid") or "").strip().lower()
+    alias = sanitize_text(data.get("alias"), 40) or "anonymous"
+    city = sanitize_text(data.get("city"), 60)
+    country = sanitize_text(data.get("country"), 60)
+
+    if not valid_txid(txid):
+        return fast_json({"ok": False, "error": "invalid txid"}, 400)
+    if not city or not country:
+        return fast_json({"ok": False, "error": "city and country are required"}, 400)
+
+    # The tx lookup and the geocode are independent network calls of
+    # ~500 ms each; running them concurrently roughly halves submit
+    # latency for the common valid-request path.
+    f_amt = _pool.submit(tx_amount_to_our_address_btc, txid, BTC_ADDRESS)
+    f_geo = _pool.submit(geocode_city_country, city, country)
+    try:
+        amount_btc = f_amt.result()
+    except Exception:
+        amount_btc = None
+    try:
+        coords = f_geo.result()
+    except Exception:
+        coords = None
+
+    if amount_btc is None:
+        return fast_json({"ok": False, "error": "transaction does not pay our address"}, 400)
+    if coords is None:
+        return fast_json({"ok": False, "error": "could not geocode that city/country"}, 400)
+    lat, lng = coords
+
+    iso_date = utc_now_iso()
+    with _write_lock:
+        writer = get_writer()
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            cur = writer.execute(
+                _INSERT_ENTRY,
+                (txid, alias, city, country, lat, lng, amount_btc, iso_date),
+            )
+            writer.execute("COMMIT")
+        except BaseException:
+            writer.execute("ROLLBACK")
+            raise
+    if cur.rowcount == 0:
+        return fast_json({"ok": False, "error": "txid already logged"}, 409)
+
+    request_export()
+    return fast_json(
+        {
+            "ok": True,
+            "amount_btc": amount_btc,
+            "lat": lat,
+            "lng": lng,
+            "iso_date": iso_date,
+        }
+    )
+
+
+@app.get("/api/log")
+def api_log():
+    # log.json is (re)written on every successful submit, so the file *is*
+    # the cache; conditional=True gives browsers ETag/304 handling and lets
+    # Werkzeug use sendfile where available.
+    resp = send_from_directory(
+        DATA_DIR, "log.json", mimetype="application/json", conditional=True
+    )
+    # The log can change on any submit: let clients cache but revalidate.
+    resp.headers["Cache-Control"] = "max-age=0, must-revalidate"
+    return resp
+
+
+_stats_cache = {"body": b"", "etag": "", "ts": 0.0}
+_stats_lock = threading.Lock()
+_STATS_TTL = 15.0
+
+
+def _stats_body():
+    """Serialized /api/stats body plus its ETag, rebuilt at most every 15 s."""
+    with _stats_lock:
+        if time.time() - _stats_cache["ts"] >= _STATS_TTL:
+            row = get_reader().execute(
+                "SELECT COUNT(*), COALESCE(SUM(amount_btc), 0) FROM entries"
+            ).fetchone()
+            body = _json_bytes(
+                {
+                    "hops": row[0],
+                    "total_btc": float(row[1]),
+                    "address_balance_btc": address_balance_cached(BTC_ADDRESS),
+                    "as_of": utc_now_iso(),
+                }
+            )
+            _stats_cache.update(
+                body=body,
+                etag=hashlib.blake2b(body, digest_size=16).hexdigest(),
+                ts=time.time(),
+            )
+        return _stats_cache["body"], _stats_cache["etag"]
+
+
+@app.get("/api/stats")
+def api_stats():
+    body, etag = _stats_body()
+    if request.headers.get("If-None-Match") == etag:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "public, max-age=15"
+    return resp
+
+
+# Small static assets served from memory: (body, etag, mtime, mimetype)
+# keyed by the resolved filesystem path, so request aliases like
+# /./index.html collapse onto one entry and the cache is bounded by the
+# number of real site files. Entries are validated against the file's
+# mtime on every hit, so edits to the site show up without a restart.
+_STATIC_MAX_BYTES = 64 * 1024
+_static_cache: dict[str, tuple[bytes, str, float, str]] = {}
+_static_lock = threading.Lock()
+
+
+def _static_response(body, etag, mimetype):
+    if request.headers.get("If-None-Match") == etag:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype=mimetype)
+    resp.headers["ETag"] = etag
+    return resp
+
+
+@app.get("/")
+@app.get("/<path:path>")
+def serve_static(path="index.html"):
+    full = safe_join(SITE_DIR, path)
+    if full is None:
+        abort(404)
+    try:
+        st = os.stat(full)
+    except OSError:
+        abort(404)
+
+    entry = _static_cache.get(full)
+    if entry is not None:
+        body, etag, mtime, mimetype = entry
+        if st.st_mtime == mtime:
+            return _static_response(body, etag, mimetype)
+        with _static_lock:
+            _static_cache.pop(full, None)
+
+    if os.path.isfile(full) and st.st_size <= _STATIC_MAX_BYTES:
+        with open(full, "rb") as f:
+            body = f.read()
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        mimetype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+        with _static_lock:
+            _static_cache[full] = (body, etag, st.st_mtime, mimetype)
+        return _static_response(body, etag, mimetype)
+
+    # Large or otherwise special files take the streaming path.
+    return send_from_directory(SITE_DIR, path, conditional=True)
+
+
+if __name__ == "__main__":
+    init_db()
+    app.run(host="127.0.0.1", port=8080, threaded=True)